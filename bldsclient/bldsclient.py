@@ -3,14 +3,57 @@ Python client to the Baccus Lab Data Server.
 (C) 2017 Benjamin Naecker bnaecker@stanford.edu
 """
 
+import asyncio
+import contextlib
+import pickle
 import socket
 import struct
 
 import numpy as np
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 _RECV_SIZE = 2048
 
-__all__ = [ 'DataFrame', 'BldsError', 'BldsClient' ]
+# Pre-compiled Structs for the message codecs, so the hot paths don't
+# re-parse the format strings on every call.
+_FRAME_HDR = struct.Struct('<ffII')
+_U32 = struct.Struct('<I')
+_F32 = struct.Struct('<f')
+_BOOL = struct.Struct('<?')
+_RANGE = struct.Struct('<ff')
+
+# Constant command prefixes, encoded once.
+_CMD_GET = b'get\n'
+_CMD_GET_SOURCE = b'get-source\n'
+_CMD_CREATE_SOURCE = b'create-source\n'
+
+# Structured dtype describing one electrode in a HiDens configuration,
+# built once so decoding a configuration reply is a zero-copy frombuffer.
+_CONFIG_DTYPE = np.dtype([
+        ('index', np.uint32),
+        ('xpos', np.uint32),
+        ('x', np.uint16),
+        ('ypos', np.uint32),
+        ('y', np.uint16),
+        ('label', np.uint8)
+    ])
+
+__all__ = [ 'DataFrame', 'BldsError', 'BldsClient', 'AsyncBldsClient' ]
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _decode_and_scale(data, gain, offset, out):
+        for c in numba.prange(data.shape[0]):
+            for s in range(data.shape[1]):
+                out[c, s] = (data[c, s] - offset) * gain
+else:
+    def _decode_and_scale(data, gain, offset, out):
+        np.subtract(data, offset, out=out)
+        out *= gain
 
 class DataFrame():
     def __init__(self, start, stop, data):
@@ -41,14 +84,19 @@ class DataFrame():
     def deserialize(buf):
         """Deserialize a DataFrame from a byte array, e.g., from a message
         recieved from the BLDS.
+
+        The buffer is wrapped in a memoryview, so that neither the header
+        nor the sample data are copied; the returned frame's array is a
+        view onto `buf`.
         """
-        start, stop, nsamples, nchannels = struct.unpack('<ffII', buf[:16])
-        return DataFrame(start, stop, np.frombuffer(buf[16:], dtype=np.int16, 
-            count=(nsamples*nchannels)).reshape(nchannels, nsamples))
+        mv = memoryview(buf)
+        start, stop, nsamples, nchannels = _FRAME_HDR.unpack_from(mv, 0)
+        return DataFrame(start, stop, np.frombuffer(mv, dtype=np.int16,
+            count=(nsamples*nchannels), offset=16).reshape(nchannels, nsamples))
 
     def serialize(self):
         """Serialize a DataFrame to bytes."""
-        return struct.pack('<ffII', self.start, self.stop,
+        return _FRAME_HDR.pack(self.start, self.stop,
                 *self.data.shape) + self.data.tobytes()
 
     def nchannels(self):
@@ -59,9 +107,173 @@ class DataFrame():
         """Return the number of samples in the chunk of data."""
         return self.data.shape[1]
 
+    def scaled(self, gain, offset=0.0, out=None):
+        """Return the frame's samples converted to engineering units.
+
+        Computes `(data - offset) * gain` as a float32 array of shape
+        (nchannels, nsamples) in a single pass over the samples, without
+        intermediate arrays. If Numba is installed, the conversion runs
+        as a parallel jit-compiled kernel.
+
+        Parameters
+        ----------
+
+        gain : float
+            The multiplicative conversion factor, e.g., the product of
+            the source's gain and ADC range.
+
+        offset : float, optional
+            A value subtracted from each sample before scaling.
+
+        out : numpy.ndarray, optional
+            A float32 array of shape (nchannels, nsamples) to write the
+            result into, to avoid an allocation per frame.
+        """
+        if out is None:
+            out = np.empty(self.data.shape, dtype=np.float32)
+        _decode_and_scale(self.data, gain, offset, out)
+        return out
+
     def __getitem__(self, *args):
         return self.data.__getitem__(*args)
 
+    @staticmethod
+    def _rebuild(start, stop, shape, buf):
+        return DataFrame(start, stop,
+                np.frombuffer(buf, dtype=np.int16).reshape(shape))
+
+    def __reduce_ex__(self, protocol):
+        """Pickle the frame, passing the sample payload out-of-band.
+
+        With pickle protocol 5 the samples are wrapped in a PickleBuffer,
+        so consumers that supply a buffer_callback (e.g., multiprocessing
+        handing frames to analysis workers) transfer them without a copy.
+        """
+        if protocol >= 5:
+            arr = np.ascontiguousarray(self.data)
+            return (DataFrame._rebuild, (self.start, self.stop, arr.shape,
+                    pickle.PickleBuffer(arr)))
+        return super().__reduce_ex__(protocol)
+
+    @property
+    def __array_interface__(self):
+        """Expose the underlying int16 array's interface, so consumers
+        such as np.asarray() or other C extensions can view the samples
+        without any per-element conversion.
+
+        Note that the array may alias the client's receive buffer;
+        consumers that keep a frame beyond the next call to `get_data()`
+        should copy it first.
+        """
+        return self.data.__array_interface__
+
+    def __buffer__(self, flags):
+        return memoryview(self.data)
+
+def _decode_f32(buf):
+    return _F32.unpack_from(buf, 0)[0]
+
+def _decode_u32(buf):
+    return _U32.unpack_from(buf, 0)[0]
+
+def _decode_bool(buf):
+    return _BOOL.unpack_from(buf, 0)[0]
+
+def _decode_str(buf):
+    return bytes(buf).decode('utf8')
+
+def _decode_aout(buf):
+    size = _U32.unpack_from(buf, 0)[0]
+    return np.frombuffer(buf, dtype=np.double, count=size, offset=4)
+
+def _decode_config(buf):
+    size = _U32.unpack_from(buf, 0)[0]
+    return np.frombuffer(buf, dtype=_CONFIG_DTYPE, count=size, offset=4)
+
+# Decoders for source and server parameter replies, keyed by parameter
+# name, so decoding is a single dict lookup rather than a chain of
+# string comparisons.
+_SOURCE_DECODERS = {
+        'gain': _decode_f32,
+        'adc-range': _decode_f32,
+        'sample-rate': _decode_f32,
+        'trigger': _decode_str,
+        'connect-time': _decode_str,
+        'start-time': _decode_str,
+        'source-type': _decode_str,
+        'device-type': _decode_str,
+        'state': _decode_str,
+        'location': _decode_str,
+        'has-analog-output': _decode_bool,
+        'nchannels': _decode_u32,
+        'plug': _decode_u32,
+        'chip-id': _decode_u32,
+        'read-interval': _decode_u32,
+        'analog-output': _decode_aout,
+        'configuration': _decode_config,
+    }
+
+_SERVER_DECODERS = {
+        'save-file': _decode_str,
+        'save-directory': _decode_str,
+        'source-type': _decode_str,
+        'source-location': _decode_str,
+        'start-time': _decode_str,
+        'recording-length': _decode_u32,
+        'read-interval': _decode_u32,
+        'recording-position': _decode_f32,
+        'recording-exists': _decode_bool,
+        'source-exists': _decode_bool,
+    }
+
+def _split_n(buf, n):
+    """Split a bytes-like object around its first `n` - 1 newlines,
+    returning a list of `n` memoryviews.
+
+    Unlike bytes.split, this never copies the segments, and it scans
+    only a small window for each delimiter, since the newline-separated
+    fields at the head of a reply are short; the final view covers the
+    whole remaining tail.
+    """
+    mv = memoryview(buf)
+    parts = []
+    start = 0
+    for _ in range(n - 1):
+        index = bytes(mv[start:start+64]).index(b'\n') + start
+        parts.append(mv[start:index])
+        start = index + 1
+    parts.append(mv[start:])
+    return parts
+
+def _make_frame_parser(nchannels, nsamples=None):
+    """Build a parser for 'data' messages specialized for a fixed shape.
+
+    After a source is created its channel count is fixed for the whole
+    recording, so the per-frame shape dispatch in DataFrame.deserialize
+    can be replaced by a parser that closes over it. If `nsamples` is
+    also given (i.e., the frame size is constant), a single destination
+    array of shape (nchannels, nsamples) is preallocated and reused for
+    every frame, so the steady-state receive path allocates nothing. In
+    that case each parsed frame overwrites the previous one; callers
+    that keep frames should copy them.
+
+    The returned callable takes a memoryview of the message payload
+    (16-byte header plus int16 samples) and an optional destination
+    array, and returns a DataFrame.
+    """
+    dst = None if nsamples is None else np.empty((nchannels, nsamples), dtype=np.int16)
+    def parse(mv, out=None):
+        start, stop, ns, _ = _FRAME_HDR.unpack_from(mv, 0)
+        data = np.frombuffer(mv, dtype=np.int16,
+                count=(nchannels*ns), offset=16).reshape(nchannels, ns)
+        if out is None and dst is not None and dst.shape[1] == ns:
+            out = dst
+        if out is not None:
+            out[...] = data
+            data = out
+        return DataFrame(start, stop, data)
+    return parse
+
 class BldsError(Exception):
     """The BldsException class is used to indicate communication errors
     with the BLDS.
@@ -86,13 +298,54 @@ class BldsClient():
         self._port = port
         self._connected = False
         self._request_all_data = False
+        self._rxpool = [bytearray(65536) for _ in range(4)]
+        self._rxidx = 0
+        self._rxhdr = bytearray(4)
+        self._rxexcess = b''
+        self._txhdr = bytearray(4)
+        self._pipeline = None
+        self._frame_parser = None
+
+    def connect(self, nodelay=True, rcvbuf=4<<20, timeout=None):
+        """Connect to the BLDS.
+
+        Parameters
+        ----------
 
-    def connect(self):
-        """Connect to the BLDS."""
+        nodelay : bool, optional
+            If True, disable Nagle's algorithm on the socket, so that small
+            control requests and replies are not delayed.
+
+        rcvbuf : int, optional
+            The requested size of the socket receive buffer, in bytes. A
+            large buffer reduces the number of reads needed per frame when
+            streaming multichannel data. Pass None to keep the OS default.
+
+        timeout : float, optional
+            A per-operation timeout in seconds; sends and receives that
+            exceed it raise socket.timeout, rather than blocking forever
+            on a wedged server. Leave as None (the default) if calls such
+            as `get_data()` are expected to legitimately block for long
+            periods. On Linux, unacknowledged transmits are additionally
+            bounded by TCP_USER_TIMEOUT, so a dead peer is detected in
+            bounded time even without a per-operation timeout.
+        """
         if self._connected:
             return
+        # Discard receive state left over from a previous connection.
+        self._rxexcess = b''
+        self._rxidx = 0
         self._sock = socket.socket()
         self._sock.connect((self._hostname, self._port))
+        if nodelay:
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if rcvbuf is not None:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if timeout is not None:
+            self._sock.settimeout(timeout)
+        if hasattr(socket, 'TCP_USER_TIMEOUT'):
+            self._sock.setsockopt(socket.IPPROTO_TCP,
+                    socket.TCP_USER_TIMEOUT, 30000)
         self._connected = True
 
     def disconnect(self):
@@ -104,6 +357,53 @@ class BldsClient():
         self._sock = None
         self._connected = False
 
+    @contextlib.contextmanager
+    def pipeline(self):
+        """Batch several requests into a single message to the BLDS.
+
+        Within the `with` block, methods that send a request do not wait
+        for the corresponding reply; the buffered requests are sent in a
+        single write when the block exits, and the replies are then
+        collected in order. This saves one network round-trip per request,
+        which can be significant for setup sequences (creating a source,
+        setting several parameters, starting a recording) when the BLDS
+        runs on a remote host.
+
+        Methods that normally return a value (such as `get()`) return None
+        inside the block; their replies are appended, in the order the
+        requests were made, to the list bound by the `with` statement, e.g.:
+
+            with client.pipeline() as replies:
+                client.create_source('file', 'data.bin')
+                client.set('recording-length', 1000)
+
+        If the server reports an error for one of the requests, every
+        queued reply is still drained (failed ones appear in the list as
+        the BldsError itself) before the first error is raised, so the
+        connection stays usable afterwards.
+        """
+        if self._pipeline is not None:
+            raise BldsError('A pipeline is already active')
+        self._pipeline = []
+        replies = []
+        try:
+            yield replies
+            requests, self._pipeline = self._pipeline, None
+            if requests:
+                self._sock.sendall(b''.join(requests))
+                error = None
+                for _ in requests:
+                    try:
+                        replies.append(self._recv_msg())
+                    except BldsError as err:
+                        replies.append(err)
+                        if error is None:
+                            error = err
+                if error is not None:
+                    raise error
+        finally:
+            self._pipeline = None
+
     def create_source(self, source_type='mcs', location=None):
         """Request that the BLDS create a data source of the given type.
 
@@ -124,15 +424,16 @@ class BldsClient():
                 raise ValueError("'file' sources require a location")
         elif source_type == 'hidens':
             location = 'localhost' if location is None else location
-        msg = '\n'.join(('create-source', source_type, location if location else ''))
-        self._send_msg(msg.encode('utf8'))
-        self._recv_msg()
+        msg = _CMD_CREATE_SOURCE + source_type.encode('utf8') + b'\n' \
+                + (location.encode('utf8') if location else b'')
+        self._send_msg(msg)
+        return self._recv_msg()
 
     def delete_source(self):
         """Request that the BLDS delete the managed data source."""
         msg = b'delete-source\n'
         self._send_msg(msg)
-        self._recv_msg()
+        return self._recv_msg()
 
     def start_recording(self):
         """Request that the BLDS start recording data to the current location for
@@ -140,34 +441,38 @@ class BldsClient():
         """
         msg = b'start-recording\n'
         self._send_msg(msg)
-        self._recv_msg()
+        return self._recv_msg()
 
     def stop_recording(self):
         """Request that the BLDS stop a running recording."""
         msg = b'stop-recording\n'
         self._send_msg(msg)
-        self._recv_msg()
+        return self._recv_msg()
 
     def get_source(self, param):
         """Request the value of a named parameter of the data source."""
-        msg = '\n'.join(('get-source', param + '\n' if not param.endswith('\n') else ''))
-        self._send_msg(msg.encode('utf8'))
-        return self._recv_msg()[-1]
+        if not param.endswith('\n'):
+            param += '\n'
+        self._send_msg(_CMD_GET_SOURCE + param.encode('utf8'))
+        reply = self._recv_msg()
+        return reply[-1] if reply is not None else None
 
     def get(self, param):
         """Request the value of a named parameter of the BLDS or its recording."""
-        msg = '\n'.join(('get', param + '\n' if not param.endswith('\n') else ''))
-        self._send_msg(msg.encode('utf8'))
-        return self._recv_msg()[-1]
+        if not param.endswith('\n'):
+            param += '\n'
+        self._send_msg(_CMD_GET + param.encode('utf8'))
+        reply = self._recv_msg()
+        return reply[-1] if reply is not None else None
 
-    def get_data(self, start=None, stop=None):
+    def get_data(self, start=None, stop=None, out=None):
         """Request a chunk of data from the BLDS.
 
         If the client has requested all data (using the `get_all_data()` method),
         this will block until the next frame is available and return it. If the
         client has not requested all data, the `start` and `stop` times must be
         given. In this case, a single frame of data will be returned when it is
-        received from the BLDS. This **will block** the client until the data 
+        received from the BLDS. This **will block** the client until the data
         requested is actually available (i.e., until `stop` has come and gone).
 
         Parameters
@@ -178,6 +483,12 @@ class BldsClient():
             previously requested all data, these are ignored, and the next frame
             is returned when available.
 
+        out : numpy.ndarray, optional
+            An int16 array of shape (nchannels, nsamples) into which the
+            frame's samples are copied. The returned frame then owns a
+            stable buffer rather than a view of the receive buffer, and
+            the steady-state path allocates nothing.
+
         Returns
         -------
 
@@ -185,10 +496,35 @@ class BldsClient():
             The frame of data.
         """
         if self._request_all_data:
-            return self._recv_msg() # Wait for data message available
-        msg = b'get-data\n' + struct.pack('<ff', start, stop)
+            return self._recv_msg(out=out) # Wait for data message available
+        msg = b'get-data\n' + _RANGE.pack(start, stop)
         self._send_msg(msg)
-        return self._recv_msg()
+        return self._recv_msg(out=out)
+
+    def specialize_frames(self, nchannels=None, nsamples=None):
+        """Specialize the parsing of data messages for a fixed frame shape.
+
+        Once the source exists its channel count is fixed, so the
+        per-frame shape dispatch can be compiled away into a parser that
+        closes over the shape (see `_make_frame_parser`). If `nsamples`
+        is also given, frames are copied into a single preallocated
+        destination array, reused across calls.
+
+        Parameters
+        ----------
+
+        nchannels : int, optional
+            The source's channel count. Queried from the source if not
+            given.
+
+        nsamples : int, optional
+            The number of samples per frame, if constant (the product of
+            the 'read-interval' and 'sample-rate' parameters).
+        """
+        if nchannels is None:
+            nchannels = self.get_source('nchannels')
+        self._frame_parser = _make_frame_parser(nchannels, nsamples)
+        return nchannels
 
     def request_all_data(self, request=True):
         """Request that the BLDS send all data as it becomes available. This
@@ -201,9 +537,9 @@ class BldsClient():
         explicit requests from the client.
         """
         self._request_all_data = request
-        msg = b'get-all-data\n' + struct.pack('<?', request)
+        msg = b'get-all-data\n' + _BOOL.pack(request)
         self._send_msg(msg)
-        self._recv_msg()
+        return self._recv_msg()
 
     def set(self, param, value):
         """Set the value of a named parameter of the BLDS or its recording."""
@@ -211,116 +547,318 @@ class BldsClient():
         if param in ('save-file', 'save-directory'):
             vals.append(value.encode('utf8'))
         elif param in ('read-interval', 'recording-length'):
-            vals.append(struct.pack('<I', value))
+            vals.append(_U32.pack(value))
         else:
             raise BldsError('Unknown server parameter: {}'.format(param))
         self._send_msg(b'\n'.join(vals))
-        self._recv_msg()
+        return self._recv_msg()
         
     def set_source(self, param, value):
-        """Set the value of a named parameter of the managed data source."""
+        """Set the value of a named parameter of the managed data source.
+
+        Array-valued parameters (such as 'analog-output') are sent
+        directly from the array's own buffer, without an intermediate
+        copy. The array must not be mutated until this method returns.
+        """
         vals = [b'set-source', param.encode('utf8')]
         if param in ('trigger', 'configuration-file'):
             vals.append(value.encode('utf8'))
         elif param == 'adc-range':
-            vals.append(struct.pack('<f', value))
+            vals.append(_F32.pack(value))
         elif param in ('analog-output',):
-            vals.append(struct.pack('<I', value.size) + value.tobytes())
+            arr = np.ascontiguousarray(value)
+            self._send_msg([b'set-source\n', param.encode('utf8'), b'\n',
+                    _U32.pack(arr.size), memoryview(arr).cast('B')])
+            return self._recv_msg()
         elif param == 'plug':
-            vals.append(struct.pack('<I', value))
+            vals.append(_U32.pack(value))
         else:
             raise BldsError('Unknown source parameter: {}'.format(param))
         self._send_msg(b'\n'.join(vals))
-        self._recv_msg()
+        return self._recv_msg()
 
     def _decode_source_param(self, name, buf):
-        if name in ('gain', 'adc-range', 'sample-rate'):
-            return struct.unpack('<f', buf[:4])[0]
-        elif name in ('trigger', 'connect-time', 'start-time', 
-                'source-type', 'device-type', 'state', 'location'):
-            return buf.decode('utf8')
-        elif name == 'has-analog-output':
-            return struct.unpack('<?', buf[:1])[0]
-        elif name in ('nchannels', 'plug', 'chip-id', 'read-interval'):
-            return struct.unpack('<I', buf[:4])[0]
-        elif name == 'analog-output':
-            size = struct.unpack('<I', buf[:4])[0]
-            aout = np.frombuffer(buf[4:], dtype=np.double, count=size)
-            return aout
-        elif name == 'configuration':
-            size = struct.unpack('<I', buf[:4])[0]
-            dtype = np.dtype([
-                    ('index', np.uint32),
-                    ('xpos', np.uint32),
-                    ('x', np.uint16),
-                    ('ypos', np.uint32),
-                    ('y', np.uint16),
-                    ('label', np.uint8)
-                ])
-            config = np.frombuffer(buf[4:], dtype=dtype, count=size)
-            return config
+        decoder = _SOURCE_DECODERS.get(name)
+        return decoder(buf) if decoder is not None else None
 
     def _decode_server_param(self, name, buf):
-        if name in ('save-file', 'save-directory', 'source-type', 
-                'source-location', 'start-time'):
-            return buf.decode('utf8')
-        elif name in ('recording-length', 'read-interval'):
-            return struct.unpack('<I', buf[:4])[0]
-        elif name == 'recording-position':
-            return struct.unpack('<f', buf[:4])[0]
-        elif name in ('recording-exists', 'source-exists'):
-            return struct.unpack('<?', buf[:1])[0]
+        decoder = _SERVER_DECODERS.get(name)
+        return decoder(buf) if decoder is not None else None
 
     def _send_msg(self, msg):
+        """Send a message to the BLDS, prefixed with its length.
+
+        `msg` may be a single bytes-like object or a list of them; lists
+        are sent as separate iovecs, so large payloads (e.g., arrays) are
+        never copied into an intermediate buffer.
+        """
         if not self._connected:
             raise ConnectionError('Not connected to BLDS')
-        self._sock.sendall(len(msg).to_bytes(4, 'little') + msg)
-
-    def _recv_msg(self):
-        buf = self._sock.recv(4, socket.MSG_WAITALL)
-        if not buf:
-            raise ConnectionError('BLDS closed the connection')
+        parts = [msg] if isinstance(msg, (bytes, bytearray, memoryview)) else list(msg)
+        total = sum(len(part) for part in parts)
+        if self._pipeline is not None:
+            self._pipeline.append(_U32.pack(total) + b''.join(parts))
+            return
+        _U32.pack_into(self._txhdr, 0, total)
+        self._send_iovecs([self._txhdr] + parts)
 
-        msg_size = struct.unpack('<I', buf)[0]
-        buf = self._sock.recv(msg_size, socket.MSG_WAITALL)
+    def _send_iovecs(self, buffers):
+        """Send a sequence of buffers to the BLDS as a single message.
 
-        msg_type, buf = buf.split(b'\n', maxsplit=1)
+        The buffers are passed to sendmsg() as separate iovecs, so the
+        length prefix and any large payloads are never concatenated into
+        an intermediate bytes object before hitting the socket.
+        """
+        buffers = [memoryview(buf) for buf in buffers]
+        while buffers:
+            nsent = self._sock.sendmsg(buffers)
+            while buffers and nsent >= len(buffers[0]):
+                nsent -= len(buffers[0])
+                del buffers[0]
+            if nsent and buffers:
+                buffers[0] = buffers[0][nsent:]
+
+    def _recv_into(self, buf, n, offset=0):
+        """Receive bytes from the BLDS into `buf` until it holds `n`,
+        starting at `offset`, returning a memoryview of the `n` bytes.
+        """
+        view = memoryview(buf)
+        nrecvd = offset
+        while nrecvd < n:
+            nbytes = self._sock.recv_into(view[nrecvd:n], n - nrecvd)
+            if nbytes == 0:
+                raise ConnectionError('BLDS closed the connection')
+            nrecvd += nbytes
+        return view[:n]
+
+    def _recv_frame(self):
+        """Receive one length-prefixed message from the BLDS, returning
+        its size and a memoryview of its payload.
+
+        The 4-byte length prefix and the start of the payload are read
+        with a single recvmsg_into() call using two iovecs, so a small
+        control reply costs one syscall rather than two; any remainder
+        of a larger message is read afterwards.
+
+        Payloads land in a small ring of persistent bytearrays, cycled
+        across messages and grown as needed, so that the steady-state
+        receive path allocates nothing. A frame returned by `get_data()`
+        therefore remains valid for the next few messages, but is
+        eventually overwritten when its slot comes around again; callers
+        that keep frames longer should copy them (or pass `out=`).
+        """
+        index = self._rxidx
+        self._rxidx = (index + 1) % len(self._rxpool)
+        buf = self._rxpool[index]
+
+        # Bytes of this message may already have arrived with a previous
+        # one; drain those before touching the socket again.
+        excess = self._rxexcess
+        if excess:
+            nhdr = min(4, len(excess))
+            self._rxhdr[:nhdr] = excess[:nhdr]
+            excess = excess[nhdr:]
+            if nhdr < 4:
+                self._recv_into(self._rxhdr, 4, offset=nhdr)
+            msg_size = _U32.unpack(self._rxhdr)[0]
+            if msg_size > len(buf):
+                buf = self._rxpool[index] = bytearray(msg_size)
+            nrecvd = min(msg_size, len(excess))
+            buf[:nrecvd] = excess[:nrecvd]
+            self._rxexcess = excess[nrecvd:]
+            return msg_size, self._recv_into(buf, msg_size, offset=nrecvd)
+
+        nbytes, *_ = self._sock.recvmsg_into(
+                [memoryview(self._rxhdr), memoryview(buf)])
+        if nbytes == 0:
+            raise ConnectionError('BLDS closed the connection')
+        if nbytes < 4:
+            self._recv_into(self._rxhdr, 4, offset=nbytes)
+            nbytes = 4
+        msg_size = _U32.unpack(self._rxhdr)[0]
+        nrecvd = nbytes - 4
+        if nrecvd > msg_size:
+            # The call read into the next message; set it aside.
+            self._rxexcess = bytes(buf[msg_size:nrecvd])
+            nrecvd = msg_size
+        if msg_size > len(buf):
+            grown = bytearray(msg_size)
+            grown[:nrecvd] = buf[:nrecvd]
+            buf = self._rxpool[index] = grown
+        return msg_size, self._recv_into(buf, msg_size, offset=nrecvd)
+
+    def _recv_msg(self, out=None):
+        if self._pipeline is not None:
+            return None # Reply collected when the pipeline exits
+        msg_size, buf = self._recv_frame()
+
+        # The message type lives in a short prefix; scan only that region
+        # for the delimiter rather than splitting (and copying) the whole
+        # message, whose tail may hold millions of bytes of samples.
+        index = buf.obj.find(b'\n', 0, min(64, msg_size))
+        if index < 0:
+            raise BldsError('Malformed message from BLDS')
+        msg_type, buf = bytes(buf[:index]), buf[index+1:]
         if msg_type == b'error':
-            raise BldsError(buf.decode('utf8'))
+            raise BldsError(bytes(buf).decode('utf8'))
         elif msg_type == b'data':
-            return DataFrame.deserialize(buf)
-        success = struct.unpack('<?', buf[:1])[0]
+            if self._frame_parser is not None:
+                return self._frame_parser(buf, out)
+            frame = DataFrame.deserialize(buf)
+            if out is not None:
+                out[...] = frame.data
+                frame.data = out
+            return frame
+        success = _BOOL.unpack_from(buf, 0)[0]
         return self._parse_message_by_type(msg_type.decode('utf8'), success, buf[1:])
 
     def _parse_message_by_type(self, msg_type, success, buf):
         if not success:
-            raise BldsError(buf.decode('utf8'))
+            raise BldsError(bytes(buf).decode('utf8'))
         if msg_type == 'get':
             # message contains server param name, and value/error message
-            name, buf = buf.split(b'\n', maxsplit=1)
-            name = name.decode('utf8')
+            name, buf = _split_n(buf, 2)
+            name = bytes(name).decode('utf8')
             return msg_type, name, self._decode_server_param(name, buf)
         elif msg_type == 'get-source':
             # message contains source param name, and value/error message
-            name, buf = buf.split(b'\n', maxsplit=1)
-            name = name.decode('utf8')
+            name, buf = _split_n(buf, 2)
+            name = bytes(name).decode('utf8')
             return msg_type, name, self._decode_source_param(name, buf)
         else:
-            # message contains possible error message or nothing if successful
-            return msg_type, buf[1:].decode('utf8') if not success else ''
+            # message is a simple acknowledgement; errors raised above
+            return msg_type, ''
 
     def _verify_reply(self, expected):
-        buf = self._sock.recv(4, socket.MSG_WAITALL)
-        if len(buf) == 0:
-            raise ConnectionError('BLDS closed the connection')
-        size = struct.unpack('<I', buf)[0]
-        buf = self._sock.recv(size, socket.MSG_WAITALL)
-        if len(buf) == 0:
-            raise ConnectionError('BLDS closed the connection')
-        msg, buf = buf.split(b'\n', maxsplit=1)
+        size, buf = self._recv_frame()
+        index = buf.obj.find(b'\n', 0, min(64, size))
+        if index < 0:
+            raise BldsError('Malformed message from BLDS')
+        msg, buf = bytes(buf[:index]), buf[index+1:]
         if msg != expected:
             raise ValueError('Message not received correctly, expected {}'.format(expected))
-        success = struct.unpack('<?', buf[:1])[0]
+        success = _BOOL.unpack_from(buf, 0)[0]
         if not success:
-            return success, buf[1:]
+            return success, bytes(buf[1:])
         return success, b''
+
+class AsyncBldsClient(BldsClient):
+    """An asyncio-based client of the BLDS.
+
+    This class mirrors the BldsClient interface, but every method that
+    talks to the server is a coroutine, so a single thread may stream
+    data from several BLDS instances (or interleave data collection with
+    other work) without blocking on each frame:
+
+        client = AsyncBldsClient()
+        await client.connect()
+        await client.request_all_data()
+        frame = await client.get_data()
+
+    The client runs on whichever event loop is current, so loop
+    implementations with faster I/O backends can be used by installing
+    the corresponding event loop policy before connecting.
+    """
+    def __init__(self, hostname='localhost', port=12345):
+        super().__init__(hostname, port)
+        self._reader = None
+        self._writer = None
+        self._timeout = None
+
+    async def connect(self, nodelay=True, rcvbuf=4<<20, timeout=None):
+        """Connect to the BLDS.
+
+        The keyword arguments are as for `BldsClient.connect()`; here
+        the per-operation `timeout` bounds each receive with
+        asyncio.wait_for, raising asyncio.TimeoutError when it expires.
+        Note that asyncio already disables Nagle's algorithm on its
+        transports.
+        """
+        if self._connected:
+            return
+        self._reader, self._writer = await asyncio.open_connection(
+                self._hostname, self._port)
+        self._timeout = timeout
+        sock = self._writer.get_extra_info('socket')
+        if nodelay and sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if rcvbuf is not None and sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if sock is not None and hasattr(socket, 'TCP_USER_TIMEOUT'):
+            sock.setsockopt(socket.IPPROTO_TCP,
+                    socket.TCP_USER_TIMEOUT, 30000)
+        self._connected = True
+
+    async def disconnect(self):
+        """Disconnect from the BLDS."""
+        if not self._connected:
+            return
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._reader = None
+        self._writer = None
+        self._connected = False
+
+    def pipeline(self):
+        raise BldsError('pipeline() is not supported by AsyncBldsClient')
+
+    async def get_source(self, param):
+        """Request the value of a named parameter of the data source."""
+        if not param.endswith('\n'):
+            param += '\n'
+        self._send_msg(_CMD_GET_SOURCE + param.encode('utf8'))
+        return (await self._recv_msg())[-1]
+
+    async def get(self, param):
+        """Request the value of a named parameter of the BLDS or its recording."""
+        if not param.endswith('\n'):
+            param += '\n'
+        self._send_msg(_CMD_GET + param.encode('utf8'))
+        return (await self._recv_msg())[-1]
+
+    async def specialize_frames(self, nchannels=None, nsamples=None):
+        """Specialize the parsing of data messages for a fixed frame shape.
+
+        As for `BldsClient.specialize_frames()`, but a coroutine, since
+        querying the channel count from the source awaits a reply.
+        """
+        if nchannels is None:
+            nchannels = await self.get_source('nchannels')
+        self._frame_parser = _make_frame_parser(nchannels, nsamples)
+        return nchannels
+
+    def _send_msg(self, msg):
+        if not self._connected:
+            raise ConnectionError('Not connected to BLDS')
+        parts = [msg] if isinstance(msg, (bytes, bytearray, memoryview)) else list(msg)
+        self._writer.write(_U32.pack(sum(len(part) for part in parts)))
+        for part in parts:
+            self._writer.write(part)
+
+    async def _recv_exact(self, n):
+        """Receive exactly `n` bytes from the BLDS."""
+        await self._writer.drain()
+        try:
+            return await asyncio.wait_for(
+                    self._reader.readexactly(n), self._timeout)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError('BLDS closed the connection')
+
+    async def _recv_msg(self, out=None):
+        msg_size = _U32.unpack(await self._recv_exact(4))[0]
+        buf = await self._recv_exact(msg_size)
+
+        msg_type, buf = _split_n(buf, 2)
+        msg_type = bytes(msg_type)
+        if msg_type == b'error':
+            raise BldsError(bytes(buf).decode('utf8'))
+        elif msg_type == b'data':
+            if self._frame_parser is not None:
+                return self._frame_parser(memoryview(buf), out)
+            frame = DataFrame.deserialize(buf)
+            if out is not None:
+                out[...] = frame.data
+                frame.data = out
+            return frame
+        success = _BOOL.unpack_from(buf, 0)[0]
+        return self._parse_message_by_type(msg_type.decode('utf8'), success, buf[1:])